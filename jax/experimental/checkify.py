@@ -13,9 +13,9 @@
 # limitations under the License.
 
 from dataclasses import dataclass
-from functools import partial
-import itertools as it
-from typing import Union, Optional, Callable, Dict
+from functools import lru_cache, partial
+import operator
+from typing import Union, Optional, Callable, Dict, Tuple
 
 import numpy as np
 
@@ -28,7 +28,7 @@ from jax.interpreters import partial_eval as pe
 from jax.tree_util import tree_flatten, tree_unflatten, register_pytree_node
 from jax._src import source_info_util, traceback_util
 from jax import lax
-from jax._src.util import as_hashable_function, unzip2, split_list
+from jax._src.util import as_hashable_function, split_list, cache
 
 source_info_util.register_exclusion(__file__)
 traceback_util.register_exclusion(__file__)
@@ -53,9 +53,14 @@ def setnewattr(obj, name, val):
 class Error:
   err: Union[bool, core.Tracer]
   code: Union[int, core.Tracer]
-  msgs: Dict[int, str]
+  msgs: Tuple[str, ...]  # indexed by code
+  # Failure flags of the checks behind the last len(pending) msgs, which are
+  # not yet folded into err and code (see flush_error).
+  pending: Tuple[Union[bool, core.Tracer], ...] = ()
 
   def get(self) -> Optional[str]:
+    if self.pending:
+      return flush_error(self).get()
     assert np.shape(self.err) == np.shape(self.code)
     if np.size(self.err) == 1:
       if self.err:
@@ -66,31 +71,68 @@ class Error:
                        for idx, e in np.ndenumerate(self.err) if e) or None
     return None
 
-register_pytree_node(Error,
-                     lambda e: ((e.err, e.code), tuple(sorted(e.msgs.items()))),
-                     lambda msgs, data: Error(*data, dict(msgs)))  # type: ignore
+def _flatten_error(e: 'Error'):
+  e = flush_error(e)  # pending checks aren't leaves, so fold them in first
+  return (e.err, e.code), e.msgs
 
-init_error = Error(False, 0, {})
-next_code = it.count(1).__next__  # globally unique ids, could be uuid4
+register_pytree_node(Error, _flatten_error,
+                     lambda msgs, data: Error(*data, msgs))  # type: ignore
+
+init_error = Error(False, 0, ())
 
 
 Bool = Union[bool, core.Tracer]
 Int = Union[int, core.Tracer]
 
 def assert_func(error: Error, pred: Bool, msg: str) -> Error:
-  code = next_code()
-  out_err = error.err | jnp.logical_not(pred)
-  out_code = lax.select(error.err, error.code, code)
-  return Error(out_err, out_code, {code: msg, **error.msgs})
+  if isinstance(pred, (bool, np.bool_)):
+    return assert_func_fail(error, not pred, msg)
+  return assert_func_fail(error, jnp.logical_not(pred), msg)
+
+def assert_func_fail(error: Error, fail: Bool, msg: str) -> Error:
+  """Like assert_func, but takes the failure condition rather than the
+  predicate, so callers that compute it directly skip a `not`."""
+  return flush_error(_record_check(error, fail, msg))
+
+def _record_check(error: Error, fail: Bool, msg: str) -> Error:
+  if isinstance(fail, (bool, np.bool_)):
+    if not fail:
+      return error  # statically satisfied, nothing to check
+    fail = True
+  # The check is only recorded here; flush_error folds all pending checks into
+  # err and code at once, rather than staging an `or` and a `select` per check.
+  return Error(error.err, error.code, (*error.msgs, msg),
+               (*error.pending, fail))
+
+def flush_error(error: Error) -> Error:
+  if not error.pending:
+    return error
+  code = len(error.msgs) - len(error.pending)  # code of the first pending check
+  if len(error.pending) == 1:
+    fail, = error.pending
+  else:
+    fails = jnp.stack(error.pending)
+    fail = jnp.any(fails)
+    code = code + jnp.argmax(fails)  # argmax picks the first failing check
+  err, code = _update_error(error.err, error.code, fail, code)
+  return Error(err, code, error.msgs)
+
+def _update_error(err: Bool, code: Int, fail: Bool, new_code: Int):
+  if isinstance(err, bool):
+    # The incoming error is static, so resolve the update at trace time
+    # rather than staging out an `or` and a `select`.
+    return (True, code) if err else (fail, new_code)
+  return err | fail, lax.select(err, code, new_code)
 
 
 ## Checkify transformation for plumbing functional error values.
 
+_get_val = operator.attrgetter('val')
+
 class ErrorTracer(core.Tracer):
   def __init__(self, trace, val):
     self._trace = trace
     self.val = val
-    core.get_aval(val), val
   aval = property(lambda self: core.get_aval(self.val))
   full_lower = lambda self: self
 
@@ -101,30 +143,30 @@ class ErrorTrace(core.Trace):
     return ErrorTracer(self, tracer.val)
 
   def process_primitive(self, primitive, tracers, params):
-    in_vals = [t.val for t in tracers]
     rule = error_checks.get(primitive)
     if rule:
+      in_vals = map(_get_val, tracers)
       out, self.main.error = rule(self.main.error, *in_vals, **params)  # type: ignore
     else:
-      out = primitive.bind(*in_vals, **params)
+      out = primitive.bind(*map(_get_val, tracers), **params)
     if primitive.multiple_results:
       return [ErrorTracer(self, x) for x in out]
     else:
       return ErrorTracer(self, out)
 
   def process_call(self, primitive, f, tracers, params):
-    in_vals = [t.val for t in tracers]
-    e = popattr(self.main, 'error')
-    f, msgs = check_errors_subtrace(f, self.main, tuple(e.msgs.items()))
+    in_vals = list(map(_get_val, tracers))
+    e = flush_error(popattr(self.main, 'error'))
+    f, msgs = check_errors_subtrace(f, self.main, e.msgs)
     params_ = dict(params, donated_invars=(False, False, *params['donated_invars']))
     err, code, *out_vals = primitive.bind(f, e.err, e.code, *in_vals, **params_)
     setnewattr(self.main, 'error', Error(err, code, msgs()))
     return [ErrorTracer(self, x) for x in out_vals]
 
   def process_map(self, primitive, f, tracers, params):
-    in_vals = [t.val for t in tracers]
-    e = popattr(self.main, 'error')
-    f, msgs = check_errors_subtrace(f, self.main, tuple(e.msgs.items()))
+    in_vals = list(map(_get_val, tracers))
+    e = flush_error(popattr(self.main, 'error'))
+    f, msgs = check_errors_subtrace(f, self.main, e.msgs)
 
     @as_hashable_function(closure=params['out_axes_thunk'])
     def new_out_axes_thunk():
@@ -139,9 +181,9 @@ class ErrorTrace(core.Trace):
     return [ErrorTracer(self, x) for x in outs]
 
   def post_process_call(self, primitive, tracers, params):
-    vals = [t.val for t in tracers]
+    vals = list(map(_get_val, tracers))
     main = self.main
-    e = popattr(self.main, 'error')
+    e = flush_error(popattr(self.main, 'error'))
     err, code, main.msgs = e.err, e.code, e.msgs
     def todo(vals):
       trace = main.with_cur_sublevel()
@@ -150,9 +192,9 @@ class ErrorTrace(core.Trace):
     return (err, code, *vals), todo
 
   def post_process_map(self, primitive, tracers, params):
-    vals = [t.val for t in tracers]
+    vals = list(map(_get_val, tracers))
     main = self.main
-    e = popattr(self.main, 'error')
+    e = flush_error(popattr(self.main, 'error'))
     err, code, main.msgs = e.err, e.code, e.msgs
     def todo(vals):
       trace = main.with_cur_sublevel()
@@ -163,8 +205,9 @@ class ErrorTrace(core.Trace):
     return (err, code, *vals), (todo, out_axes_transform)
 
 def _reduce_any_error(errs, codes):
-  errs_, codes_ = lax.sort_key_val(errs, codes, dimension=0)
-  return errs_[-1], codes_[-1]
+  # codes[0] is only returned when there is no error, in which case the code is
+  # never read, so there's no need to select a zero code.
+  return jnp.any(errs), codes[jnp.argmax(errs)]
 
 ErrorCheckRule = Callable
 error_checks: Dict[core.Primitive, ErrorCheckRule] = {}
@@ -179,36 +222,64 @@ def check_errors_flat(fun: lu.WrappedFun, *args):
 def check_errors_toplevel(*args):
   error = init_error
   with core.new_main(ErrorTrace) as main:
-    msgs = tuple(error.msgs.items())
-    outs = yield (main, msgs, error.err, error.code, *args), {}
+    outs = yield (main, error.msgs, error.err, error.code, *args), {}
     del main
   yield outs
 
 @lu.transformation_with_aux
 def check_errors_subtrace(main, msgs, err, code, *args):
-  setnewattr(main, 'error', Error(err, code, dict(msgs)))
+  setnewattr(main, 'error', Error(err, code, msgs))
   trace = main.with_cur_sublevel()
   in_tracers = [ErrorTracer(trace, x) for x in args]
   out = yield in_tracers, {}
   out_tracers = map(trace.full_raise, out)
-  out_vals = [t.val for t in out_tracers]
-  err, code, msgs = main.error.err, main.error.code, main.error.msgs
-  del main.error
+  out_vals = list(map(_get_val, out_tracers))
+  error = flush_error(popattr(main, 'error'))
+  err, code, msgs = error.err, error.code, error.msgs
   yield (err, code, *out_vals), msgs
 
-def checkify_fun_to_jaxpr(f, error, in_avals):
-  f, msgs = check_errors_subtrace(f)
-  f = check_errors_traceable(f, tuple(error.msgs.items()))
-  err_aval = core.raise_to_shaped(core.get_aval(error.err))
-  code_aval = core.raise_to_shaped(core.get_aval(error.code))
+def checkify_fun_to_jaxpr(f, err_aval, code_aval, msgs, in_avals):
+  f, msgs_out = check_errors_subtrace(f)
+  f = check_errors_traceable(f, msgs)
   avals_in = [err_aval, code_aval, *in_avals]
   jaxpr_out, _, literals_out = pe.trace_to_jaxpr_dynamic(f, avals_in)
-  return core.ClosedJaxpr(jaxpr_out, literals_out), msgs()
+  return core.ClosedJaxpr(jaxpr_out, literals_out), msgs_out()
+
+def error_avals(error):
+  return (core.raise_to_shaped(core.get_aval(error.err)),
+          core.raise_to_shaped(core.get_aval(error.code)))
 
-# TODO take (error_aval, code_aval) instead of error here?
 def checkify_jaxpr(jaxpr, error):
+  return _checkify_jaxpr(jaxpr, *error_avals(error), error.msgs)
+
+@cache()
+def _checkify_jaxpr(jaxpr, err_aval, code_aval, msgs):
+  return _checkify_jaxpr_uncached(jaxpr, err_aval, code_aval, msgs)
+
+def _checkify_jaxpr_uncached(jaxpr, err_aval, code_aval, msgs):
+  if not jaxpr_has_checks(jaxpr.jaxpr):
+    # Nothing in here can fail, so skip tracing it through the error trace.
+    return forward_errors_jaxpr(jaxpr, err_aval, code_aval), msgs
   f = lu.wrap_init(core.jaxpr_as_fun(jaxpr))
-  return checkify_fun_to_jaxpr(f, error, jaxpr.in_avals)
+  return checkify_fun_to_jaxpr(f, err_aval, code_aval, msgs, jaxpr.in_avals)
+
+def jaxpr_has_checks(jaxpr: core.Jaxpr) -> bool:
+  """Returns whether checkifying `jaxpr` could add any error checks."""
+  # Control-flow rules only add the checks found in their sub-jaxprs.
+  return any((eqn.primitive in error_checks and
+              eqn.primitive not in control_flow_prims) or
+             any(map(jaxpr_has_checks, core.jaxprs_in_params(eqn.params)))
+             for eqn in jaxpr.eqns)
+
+def forward_errors_jaxpr(jaxpr, err_aval, code_aval):
+  """Constructs a jaxpr which takes two extra args and returns them as is."""
+  consts = jaxpr.consts
+  jaxpr = jaxpr.jaxpr
+  new_vars = core.gensym([jaxpr])
+  err_var, code_var = new_vars(err_aval), new_vars(code_aval)
+  new_jaxpr = core.Jaxpr(jaxpr.constvars, (err_var, code_var, *jaxpr.invars),
+                         (err_var, code_var, *jaxpr.outvars), jaxpr.eqns)
+  return core.ClosedJaxpr(new_jaxpr, consts)
 
 # TODO dedup with check_errors_toplevel
 @lu.transformation
@@ -224,15 +295,14 @@ def check_errors_traceable(msgs, err, code, *args):
 def assert_(pred: Bool, msg: str) -> None:
   if not is_scalar_pred(pred):
     raise TypeError(f"assert_ takes a scalar pred as argument, got {pred}")
-  code = next_code()
-  return assert2_(pred, code, {code: msg})
+  return assert2_(pred, 0, (msg,))
 
 def is_scalar_pred(pred) -> bool:
   return (isinstance(pred, bool) or
           isinstance(pred, jnp.ndarray) and pred.shape == () and
           pred.dtype == jnp.dtype('bool'))
 
-def assert2_(pred: Bool, code: Int, msgs: Dict[int, str]) -> None:
+def assert2_(pred: Bool, code: Int, msgs: Tuple[str, ...]) -> None:
   return assert_p.bind(pred, code, msgs=msgs)
 
 assert_p = core.Primitive('assert')
@@ -253,11 +323,28 @@ def assert_abstract_eval(pred, code, *, msgs):
 def summary() -> str:
   return str(source_info_util.summarize(source_info_util.current()))
 
+def any_nan(x):
+  is_nan = lax.ne(x, x)  # only nans compare unequal to themselves
+  if not np.ndim(x):
+    return is_nan
+  # Reduce with a single reduce_or, which XLA fuses with the comparison.
+  return lax.reduce(is_nan, False, lax.bitwise_or, tuple(range(np.ndim(x))))
+
 def nan_error_check(prim, error, *in_vals, **params):
   out = prim.bind(*in_vals, **params)
-  no_nans = jnp.logical_not(jnp.any(jnp.isnan(out)))
+  if not jnp.issubdtype(out.dtype, jnp.inexact):
+    return out, error  # only inexact dtypes can hold nans
   msg = f"nan generated by primitive {prim.name} at {summary()}"
-  return out, assert_func(error, no_nans, msg)
+  return out, _record_check(error, any_nan(out), msg)
+
+# The index bound helpers only take static shapes and dtypes, so they use a
+# plain lru_cache rather than util.cache, which also keys on the trace context.
+@lru_cache(maxsize=None)
+def _gather_upper_bound(operand_shape, start_index_map, slice_sizes):
+  # compare to OOB masking logic in lax._gather_translation_rule
+  start_index_map = list(start_index_map)
+  return (np.array(operand_shape)[start_index_map] -
+          np.array(slice_sizes)[start_index_map])
 
 def gather_error_check(error, operand, start_indices, *,
                        dimension_numbers, slice_sizes, unique_indices,
@@ -267,47 +354,49 @@ def gather_error_check(error, operand, start_indices, *,
       slice_sizes=slice_sizes, unique_indices=unique_indices,
       indices_are_sorted=indices_are_sorted, mode=mode, fill_value=fill_value)
 
-  # compare to OOB masking logic in lax._gather_translation_rule
-  dnums = dimension_numbers
-  operand_dims = np.array(operand.shape)
-
-  upper_bound = operand_dims[np.array(dnums.start_index_map)]
-  upper_bound -= np.array(slice_sizes)[np.array(dnums.start_index_map)]
-  all_inbounds = jnp.all((start_indices >= 0) & (start_indices <= upper_bound))
+  upper_bound = _gather_upper_bound(operand.shape,
+                                    tuple(dimension_numbers.start_index_map),
+                                    tuple(slice_sizes))
+  out_of_bounds = jnp.any((start_indices < 0) | (start_indices > upper_bound))
 
   msg = f"out-of-bounds indexing at {summary()}"
-  return out, assert_func(error, all_inbounds, msg)
+  return out, _record_check(error, out_of_bounds, msg)
 error_checks[lax.gather_p] = gather_error_check
 
 def div_error_check(error, x, y):
   """Checks for division by zero and NaN."""
-  all_nonzero = jnp.logical_not(jnp.any(jnp.equal(y, 0)))
+  any_zero = jnp.any(jnp.equal(y, 0))
   msg = f'divided by zero at {summary()}'
-  div_by_zero_err = assert_func(error, all_nonzero, msg)
+  div_by_zero_err = _record_check(error, any_zero, msg)
   return nan_error_check(lax.div_p, div_by_zero_err, x, y)
 error_checks[lax.div_p] = div_error_check
 
-def scatter_in_bounds(operand, indices, updates, dnums):
+@lru_cache(maxsize=None)
+def _scatter_upper_bound(operand_shape, updates_shape, dnums, index_dtype):
   # Ref: see clamping code used in scatter_translation_rule
   slice_sizes = []
   pos = 0
-  for i in range(len(operand.shape)):
+  for i in range(len(operand_shape)):
     if i in dnums.inserted_window_dims:
       slice_sizes.append(1)
     else:
-      slice_sizes.append(updates.shape[dnums.update_window_dims[pos]])
+      slice_sizes.append(updates_shape[dnums.update_window_dims[pos]])
       pos += 1
 
-  upper_bound = np.array([operand.shape[i] - slice_sizes[i]
+  upper_bound = np.array([operand_shape[i] - slice_sizes[i]
                           for i in dnums.scatter_dims_to_operand_dims],
                          np.int64)
-  upper_bound = np.minimum(upper_bound, np.iinfo(indices.dtype).max)
-  upper_bound = lax.broadcast_in_dim(upper_bound, indices.shape,
-                                     (len(indices.shape) - 1,))
-
-  lower_in_bounds = jnp.all(jnp.greater_equal(indices, 0))
-  upper_in_bounds = jnp.all(jnp.less_equal(indices, upper_bound))
-  return jnp.logical_and(lower_in_bounds, upper_in_bounds)
+  upper_bound = np.minimum(upper_bound, np.iinfo(index_dtype).max)
+  return upper_bound.astype(index_dtype)
+
+def scatter_out_of_bounds(operand, indices, updates, dnums):
+  # The bound is a constant over the trailing index vector dimension of
+  # indices, so let it broadcast rather than staging a broadcast_in_dim.
+  upper_bound = _scatter_upper_bound(operand.shape, updates.shape, dnums,
+                                     indices.dtype)
+  out_of_bounds = jnp.logical_or(jnp.less(indices, 0),
+                                 jnp.greater(indices, upper_bound))
+  return jnp.any(out_of_bounds)
 
 def scatter_error_check(prim, error, operand, indices, updates, *,
                         update_jaxpr, update_consts,
@@ -320,13 +409,15 @@ def scatter_error_check(prim, error, operand, indices, updates, *,
       indices_are_sorted=indices_are_sorted, unique_indices=unique_indices,
       mode=mode)
 
-  in_bounds = scatter_in_bounds(operand, indices, updates, dimension_numbers)
+  out_of_bounds = scatter_out_of_bounds(operand, indices, updates,
+                                        dimension_numbers)
   oob_msg = f'out-of-bounds indexing while updating at {summary()}'
-  oob_error = assert_func(error, in_bounds, oob_msg)
+  oob_error = _record_check(error, out_of_bounds, oob_msg)
 
-  no_nans = jnp.logical_not(jnp.any(jnp.isnan(out)))
+  if not jnp.issubdtype(out.dtype, jnp.inexact):
+    return out, oob_error
   nan_msg = f'nan generated by primitive {prim.name} at {summary()}'
-  return out, assert_func(oob_error, no_nans, nan_msg)
+  return out, _record_check(oob_error, any_nan(out), nan_msg)
 error_checks[lax.scatter_p] = partial(scatter_error_check, lax.scatter_p)
 error_checks[lax.scatter_add_p] = partial(scatter_error_check, lax.scatter_add_p)
 error_checks[lax.scatter_mul_p] = partial(scatter_error_check, lax.scatter_mul_p)
@@ -334,18 +425,23 @@ error_checks[lax.scatter_min_p] = partial(scatter_error_check, lax.scatter_min_p
 error_checks[lax.scatter_max_p] = partial(scatter_error_check, lax.scatter_max_p)
 
 def cond_error_check(error, index, *ops, branches, linear):
-  new_branches, msgs_ = unzip2(checkify_jaxpr(jxpr, error) for jxpr in branches)
+  error = flush_error(error)
+  # Thread msgs through the branches so that each one assigns fresh codes.
+  new_branches, msgs = [], error.msgs
+  for jxpr in branches:
+    new_jxpr, msgs = checkify_jaxpr(jxpr, Error(error.err, error.code, msgs))
+    new_branches.append(new_jxpr)
   new_linear = (False, False, *linear)
   err, code, *outs = lax.cond_p.bind(
       index, error.err, error.code, *ops,
       branches=tuple(new_branches), linear=new_linear)
-  new_msgs = {k:v for d in it.chain([error.msgs], msgs_) for k, v in d.items()}
-  return outs, Error(err, code, new_msgs)
+  return outs, Error(err, code, msgs)
 error_checks[lax.cond_p] = cond_error_check
 
 def scan_error_check(error, *in_flat, reverse, length, jaxpr, num_consts, num_carry, linear, unroll):
+  error = flush_error(error)
   consts, carry, xs = split_list(in_flat, [num_consts, num_carry])
-  checked_jaxpr, msgs_ = checkify_jaxpr(jaxpr, error)
+  checked_jaxpr, msgs = checkify_jaxpr(jaxpr, error)
   new_linear = (False, False, *linear)
   new_in_flat = [*consts, error.err, error.code, *carry, *xs]
   err, code, *outs = lax.scan_p.bind(
@@ -353,58 +449,105 @@ def scan_error_check(error, *in_flat, reverse, length, jaxpr, num_consts, num_ca
       reverse=reverse, length=length, jaxpr=checked_jaxpr,
       num_consts=len(consts), num_carry=len(carry)+2,
       linear=new_linear, unroll=unroll)
-  new_msgs = {**error.msgs, **msgs_}
-  return outs, Error(err, code, new_msgs)
+  return outs, Error(err, code, msgs)
 error_checks[lax.scan_p] = scan_error_check
 
-def checkify_while_body_jaxpr(cond_jaxpr, body_jaxpr, error):
-  cond_f = core.jaxpr_as_fun(cond_jaxpr)
-  body_f = core.jaxpr_as_fun(body_jaxpr)
-  def new_body_f(*vals):
-    out = body_f(*vals)
-    _ = cond_f(*out)  # this checks if the next cond application will error
-    return out
-  return checkify_fun_to_jaxpr(lu.wrap_init(new_body_f), error, body_jaxpr.in_avals)
-
-def ignore_errors_jaxpr(jaxpr, error):
-  """Constructs a jaxpr which takes two extra args but ignores them."""
-  err_aval = core.raise_to_shaped(core.get_aval(error.err))
-  code_aval = core.raise_to_shaped(core.get_aval(error.code))
+def checkify_while_body_jaxpr(cond_jaxpr, body_jaxpr, cond_nconsts,
+                              body_nconsts, error):
+  return _checkify_while_body_jaxpr(cond_jaxpr, body_jaxpr, cond_nconsts,
+                                    body_nconsts, *error_avals(error),
+                                    error.msgs)
+
+@cache()
+def _checkify_while_body_jaxpr(cond_jaxpr, body_jaxpr, cond_nconsts,
+                               body_nconsts, err_aval, code_aval, msgs):
+  # The body also applies cond to its output, which checks if the next cond
+  # application will error.
+  body_and_cond = splice_cond_after_body(cond_jaxpr, body_jaxpr, cond_nconsts)
+  # body_and_cond is new on every call, so caching on it would never hit.
+  checked_jaxpr, msgs = _checkify_jaxpr_uncached(body_and_cond, err_aval,
+                                                 code_aval, msgs)
+  # while_loop passes the body its consts first, so err and code go after them.
+  consts = checked_jaxpr.consts
+  jaxpr = checked_jaxpr.jaxpr
+  err_var, code_var, *invars = jaxpr.invars
+  const_invars, carry_invars = split_list(invars, [cond_nconsts + body_nconsts])
+  new_invars = (*const_invars, err_var, code_var, *carry_invars)
+  new_jaxpr = core.Jaxpr(jaxpr.constvars, new_invars, jaxpr.outvars, jaxpr.eqns)
+  return core.ClosedJaxpr(new_jaxpr, consts), msgs
+
+def splice_cond_after_body(cond_jaxpr, body_jaxpr, cond_nconsts):
+  """Constructs a jaxpr which applies body_jaxpr and then cond_jaxpr to its
+  output, taking the cond consts followed by the body inputs and returning the
+  body outputs."""
+  cond, body = cond_jaxpr.jaxpr, body_jaxpr.jaxpr
+  cond_const_invars, cond_carry_invars = split_list(cond.invars, [cond_nconsts])
+  env = dict(zip(cond_carry_invars, body.outvars))
+  read = lambda v: v if type(v) is core.Literal else env.get(v, v)
+  cond_eqns = [eqn._replace(invars=[read(v) for v in eqn.invars])
+               for eqn in cond.eqns]
+  new_jaxpr = core.Jaxpr((*body.constvars, *cond.constvars),
+                         (*cond_const_invars, *body.invars),
+                         body.outvars, (*body.eqns, *cond_eqns))
+  return core.ClosedJaxpr(new_jaxpr, (*body_jaxpr.consts, *cond_jaxpr.consts))
+
+def ignore_errors_jaxpr(jaxpr, error, nconsts):
+  """Constructs a jaxpr which takes two extra args, after its first nconsts
+  args, but ignores them."""
+  return _ignore_errors_jaxpr(jaxpr, *error_avals(error), nconsts)
+
+@cache()
+def _ignore_errors_jaxpr(jaxpr, err_aval, code_aval, nconsts):
   consts = jaxpr.consts
   jaxpr = jaxpr.jaxpr
   new_vars = core.gensym([jaxpr])
-  new_invars = (new_vars(err_aval), new_vars(code_aval), *jaxpr.invars)
+  const_invars, invars = split_list(jaxpr.invars, [nconsts])
+  new_invars = (*const_invars, new_vars(err_aval), new_vars(code_aval), *invars)
   new_jaxpr = core.Jaxpr(jaxpr.constvars, new_invars,
                          jaxpr.outvars, jaxpr.eqns)
   return core.ClosedJaxpr(new_jaxpr, consts)
 
 def while_loop_error_check(error, *in_flat, cond_nconsts, cond_jaxpr, body_nconsts, body_jaxpr):
+  error = flush_error(error)
   checked_cond_jaxpr, msgs_cond = checkify_jaxpr(cond_jaxpr, error)
   checked_cond_fun = core.jaxpr_as_fun(checked_cond_jaxpr)
-  # Check if the first cond application will error.
-  cond_err, cond_code, _ = checked_cond_fun(error.err, error.code, *in_flat)
-
-  checked_body_jaxpr, msgs_body = checkify_while_body_jaxpr(cond_jaxpr, body_jaxpr, error)
-  compat_cond_jaxpr = ignore_errors_jaxpr(cond_jaxpr, error)
   c_consts, b_consts, carry = split_list(in_flat, [cond_nconsts, body_nconsts])
-  new_in_flat = [*c_consts, *b_consts, cond_err, cond_code, *carry]
+  # Check if the first cond application will error.
+  cond_err, cond_code, _ = checked_cond_fun(error.err, error.code, *c_consts,
+                                            *carry)
+
+  checked_body_jaxpr, msgs_body = checkify_while_body_jaxpr(
+      cond_jaxpr, body_jaxpr, cond_nconsts, body_nconsts,
+      Error(error.err, error.code, msgs_cond))
+  compat_cond_jaxpr = ignore_errors_jaxpr(cond_jaxpr, error, cond_nconsts)
+  # The checked body also takes the cond consts, ahead of its own.
+  new_in_flat = [*c_consts, *c_consts, *b_consts, cond_err, cond_code, *carry]
   err, code, *out = lax.while_p.bind(
       *new_in_flat,
       cond_nconsts=cond_nconsts,
       cond_jaxpr=compat_cond_jaxpr,
-      body_nconsts=body_nconsts,
+      body_nconsts=cond_nconsts + body_nconsts,
       body_jaxpr=checked_body_jaxpr)
-  new_msgs = {**error.msgs, **msgs_body, **msgs_cond}
-  return out, Error(err, code, new_msgs)
+  return out, Error(err, code, msgs_body)
 error_checks[lax.while_p] = while_loop_error_check
 
+control_flow_prims = {lax.cond_p, lax.scan_p, lax.while_p}
+
 # TODO(mattjj,lenamartens): currently we bundle effectful-assert-discharging
 # with the error-check-adding transformation (checkify), but they could be
 # separated into two orthogonal transformations.
 def assert_discharge_rule(error, pred, code, *, msgs):
-  out_err = error.err | jnp.logical_not(pred)
-  out_code = lax.select(error.err, error.code, code)
-  return [], Error(out_err, out_code, {**error.msgs, **msgs})
+  if isinstance(pred, (bool, np.bool_)):
+    if pred:
+      return [], error  # statically satisfied, nothing to check
+    fail = True
+  else:
+    fail = jnp.logical_not(pred)
+  error = flush_error(error)
+  # Codes index into msgs, so shift them past the msgs already in error.
+  code = code + len(error.msgs) if error.msgs else code
+  err, code = _update_error(error.err, error.code, fail, code)
+  return [], Error(err, code, (*error.msgs, *msgs))
 error_checks[assert_p] = assert_discharge_rule
 
 
@@ -425,63 +568,18 @@ def checkify(fun: Callable) -> Callable:
 def add_nan_check(prim):
   error_checks[prim] = partial(nan_error_check, prim)
 
-add_nan_check(lax.floor_p)
-add_nan_check(lax.ceil_p)
-add_nan_check(lax.round_p)
-add_nan_check(lax.sign_p)
-add_nan_check(lax.shift_left_p)
-add_nan_check(lax.shift_right_arithmetic_p)
-add_nan_check(lax.shift_right_logical_p)
-add_nan_check(lax.bitcast_convert_type_p)
-add_nan_check(lax.real_p)
-add_nan_check(lax.complex_p)
-add_nan_check(lax.conj_p)
-add_nan_check(lax.imag_p)
-add_nan_check(lax.add_p)
-add_nan_check(lax.sub_p)
-add_nan_check(lax.convert_element_type_p)
-add_nan_check(lax.broadcast_in_dim_p)
-add_nan_check(lax.concatenate_p)
-add_nan_check(lax.pad_p)
-add_nan_check(lax.reshape_p)
-add_nan_check(lax.rev_p)
-add_nan_check(lax.transpose_p)
-add_nan_check(lax.slice_p)
-add_nan_check(lax.reduce_sum_p)
-add_nan_check(lax.reduce_window_sum_p)
-add_nan_check(lax.fft_p)
-add_nan_check(lax.cumsum_p)
-add_nan_check(lax.cumprod_p)
-add_nan_check(lax.cummax_p)
-add_nan_check(lax.cummin_p)
-add_nan_check(lax.erf_p)
-add_nan_check(lax.expm1_p)
-add_nan_check(lax.log1p_p)
-add_nan_check(lax.sqrt_p)
-add_nan_check(lax.rsqrt_p)
-add_nan_check(lax.asinh_p)
-add_nan_check(lax.acosh_p)
-add_nan_check(lax.atanh_p)
-add_nan_check(lax.erfc_p)
-add_nan_check(lax.rem_p)
-add_nan_check(lax.clamp_p)
-add_nan_check(lax.erf_inv_p)
-add_nan_check(lax.exp_p)
-add_nan_check(lax.pow_p)
-add_nan_check(lax.integer_pow_p)
-add_nan_check(lax.tanh_p)
-add_nan_check(lax.log_p)
-add_nan_check(lax.atan2_p)
-add_nan_check(lax.sin_p)
-add_nan_check(lax.cos_p)
-add_nan_check(lax.sinh_p)
-add_nan_check(lax.cosh_p)
-add_nan_check(lax.dot_general_p)
-add_nan_check(lax.mul_p)
-add_nan_check(lax.conv_general_dilated_p)
-add_nan_check(lax.reduce_max_p)
-add_nan_check(lax.reduce_min_p)
-add_nan_check(lax.abs_p)
-add_nan_check(lax.select_p)
-add_nan_check(lax.max_p)
-add_nan_check(lax.min_p)
+nan_checked_prims = (
+    lax.floor_p, lax.ceil_p, lax.round_p, lax.sign_p, lax.shift_left_p,
+    lax.shift_right_arithmetic_p, lax.shift_right_logical_p,
+    lax.bitcast_convert_type_p, lax.real_p, lax.complex_p, lax.conj_p,
+    lax.imag_p, lax.add_p, lax.sub_p, lax.reduce_sum_p, lax.reduce_window_sum_p,
+    lax.fft_p, lax.cumsum_p, lax.cumprod_p, lax.cummax_p, lax.cummin_p,
+    lax.erf_p, lax.expm1_p, lax.log1p_p, lax.sqrt_p, lax.rsqrt_p, lax.asinh_p,
+    lax.acosh_p, lax.atanh_p, lax.erfc_p, lax.rem_p, lax.clamp_p, lax.erf_inv_p,
+    lax.exp_p, lax.pow_p, lax.integer_pow_p, lax.tanh_p, lax.log_p, lax.atan2_p,
+    lax.sin_p, lax.cos_p, lax.sinh_p, lax.cosh_p, lax.dot_general_p, lax.mul_p,
+    lax.conv_general_dilated_p, lax.reduce_max_p, lax.reduce_min_p, lax.abs_p,
+    lax.select_p, lax.max_p, lax.min_p,
+)
+error_checks.update((prim, partial(nan_error_check, prim))
+                    for prim in nan_checked_prims)
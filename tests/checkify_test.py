@@ -145,6 +145,36 @@ class CheckifyTransformTests(jtu.JaxTestCase):
     self.assertIsNotNone(err.get())
     self.assertStartsWith(err.get(), 'out-of-bounds indexing')
 
+  def test_codes_are_local_to_each_checkify_call(self):
+    f = checkify.checkify(jnp.sin)
+    err1, _ = f(jnp.inf)
+    err2, _ = f(jnp.inf)
+    self.assertLen(err1.msgs, 1)
+    self.assertEqual(err1.msgs, err2.msgs)
+    self.assertEqual(int(err1.code), 0)
+    self.assertEqual(int(err2.code), 0)
+
+  def test_batched_checks_report_first_failure(self):
+    def f(x):
+      return jnp.cos(jnp.sin(x))
+
+    jaxpr = jax.make_jaxpr(checkify.checkify(f))(1.)
+    self.assertNotIn('select', str(jaxpr))
+
+    err, _ = checkify.checkify(f)(jnp.inf)
+    self.assertIsNotNone(err.get())
+    self.assertStartsWith(err.get(), 'nan generated by primitive sin')
+
+  def test_no_nan_check_on_data_movement_or_ints(self):
+    def f(x, i):
+      return jnp.reshape(x, (2, 2)).T, i + i
+
+    jaxpr = jax.make_jaxpr(checkify.checkify(f))(jnp.ones(4), jnp.arange(3))
+    self.assertNotIn('reduce_or', str(jaxpr))
+
+    err, _ = checkify.checkify(f)(jnp.full(4, jnp.nan), jnp.arange(3))
+    self.assertIsNone(err.get())
+
   @jtu.skip_on_devices('tpu')
   def test_pmap_basic(self):
     if len(jax.devices()) < 2:
@@ -183,6 +213,30 @@ class CheckifyTransformTests(jtu.JaxTestCase):
     err, y = checkify.checkify(f)(-jnp.inf)
     self.assertIs(err.get(), None)
 
+  def test_cond_without_checks(self):
+    @jax.jit
+    def f(x):
+      return lax.cond(x > 0, lambda: x, lambda: -x)
+
+    err, y = checkify.checkify(f)(-3.)
+    self.assertIs(err.get(), None)
+    self.assertArraysEqual(y, f(-3.))
+
+  @jtu.skip_on_devices('tpu')
+  def test_cond_both_branches(self):
+    @jax.jit
+    def f(x):
+      return lax.cond(x > 0,
+                      lambda: jnp.sin(x),
+                      lambda: jnp.cos(x))
+
+    err, _ = checkify.checkify(f)(jnp.inf)
+    self.assertIsNotNone(err.get())
+    self.assertStartsWith(err.get(), 'nan generated by primitive sin')
+
+    err, _ = checkify.checkify(f)(-jnp.inf)
+    self.assertIsNotNone(err.get())
+    self.assertStartsWith(err.get(), 'nan generated by primitive cos')
 
   @jtu.skip_on_devices('tpu')
   def test_scan_map(self):
@@ -206,6 +260,28 @@ class CheckifyTransformTests(jtu.JaxTestCase):
     self.assertStartsWith(err.get(), "nan generated by primitive sin")
     self.assertArraysEqual(ch_outs, outs)
 
+  def _traced_checkify_params(self, f, *args, primitive):
+    """Traces checkify(f) twice, returning the params of the `primitive` eqn in
+    each jaxpr."""
+    if config.jax_check_tracer_leaks:
+      self.skipTest("util.cache is bypassed when checking for tracer leaks")
+    def params():
+      jaxpr = jax.make_jaxpr(checkify.checkify(f))(*args).jaxpr
+      return next(eqn.params for eqn in jaxpr.eqns
+                  if eqn.primitive is primitive)
+    return params(), params()
+
+  def test_scan_checkify_jaxpr_cached(self):
+    def scan_body(_, x):
+      return None, jnp.sin(x)
+
+    def f(xs):
+      return lax.scan(scan_body, None, xs)
+
+    params1, params2 = self._traced_checkify_params(
+        f, jnp.array([0., 2.]), primitive=lax.scan_p)
+    self.assertIs(params1['jaxpr'], params2['jaxpr'])
+
   @jtu.skip_on_devices('tpu')
   def test_scan_carry(self):
     def scan_body(carry, x):
@@ -319,6 +395,42 @@ class CheckifyTransformTests(jtu.JaxTestCase):
     self.assertIsNotNone(err.get())
     self.assertStartsWith(err.get(), "divided by zero")
 
+  @jtu.skip_on_devices("tpu")
+  def test_while_loop_with_consts(self):
+    @jax.jit
+    def f(init_val, x, limit):
+      # cond closes over limit and body closes over x
+      return lax.while_loop(lambda val: val / limit < 1.,
+                            lambda val: val + jnp.sin(x), init_val)
+
+    err, ch_out = checkify.checkify(f)(0., 1., 2.)
+    out = f(0., 1., 2.)
+    self.assertIs(err.get(), None)
+    self.assertArraysEqual(ch_out, out)
+
+    err, _ = checkify.checkify(f)(0., jnp.inf, 2.)
+    self.assertIsNotNone(err.get())
+    self.assertStartsWith(err.get(), "nan generated by primitive sin")
+
+    err, _ = checkify.checkify(f)(0., 1., 0.)
+    self.assertIsNotNone(err.get())
+    self.assertStartsWith(err.get(), "divided by zero")
+
+  def test_while_loop_jaxprs_cached(self):
+    def while_cond(val):
+      return val < 2.
+
+    def while_body(val):
+      return val + jnp.sin(val)
+
+    def f(init_val):
+      return lax.while_loop(while_cond, while_body, init_val)
+
+    params1, params2 = self._traced_checkify_params(f, 0.,
+                                                    primitive=lax.while_p)
+    self.assertIs(params1['cond_jaxpr'], params2['cond_jaxpr'])
+    self.assertIs(params1['body_jaxpr'], params2['body_jaxpr'])
+
   @jtu.skip_on_devices("tpu")
   def test_while_loop_body_and_cond_error(self):
     def while_cond(val):
@@ -392,9 +504,24 @@ class AssertPrimitiveTests(jtu.JaxTestCase):
     self.assertIsNotNone(err.get())
     self.assertStartsWith(err.get(), "must be positive")
 
+  def test_assert_func_static_pred(self):
+    error = checkify.assert_func(checkify.init_error, True, "never fails")
+    self.assertIs(error, checkify.init_error)
+
+    error = checkify.assert_func(checkify.init_error, False, "always fails")
+    self.assertIs(error.err, True)
+    self.assertEqual(error.code, 0)
+    self.assertEqual(error.get(), "always fails")
+
+    # Checks recorded by the error check rules are still pending, but neither
+    # get() nor flattening loses them.
+    error = checkify._record_check(checkify.init_error, True, "always fails")
+    self.assertEqual(error.get(), "always fails")
+    self.assertEqual(jax.tree_util.tree_leaves(error), [True, 0])
+
   def test_assert2(self):
     def f(pred):  # note: data dependence needed!
-      checkify.assert2_(pred, 0, {0: "hi"})
+      checkify.assert2_(pred, 0, ("hi",))
 
     with self.assertRaisesRegex(AssertionError, "hi"):
       f(False)
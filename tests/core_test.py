@@ -14,10 +14,10 @@
 
 
 from collections import namedtuple
-from functools import partial
+from functools import lru_cache, partial
 import gc
-import itertools as it
-import operator
+import os
+import re
 import unittest
 
 import numpy as np
@@ -33,13 +33,23 @@ from jax._src import test_util as jtu
 from jax._src.abstract_arrays import make_shaped_array
 from jax import jvp, linearize, vjp, jit, make_jaxpr
 from jax.core import UnshapedArray, ShapedArray
-from jax.tree_util import tree_flatten, tree_unflatten, tree_multimap, tree_reduce, tree_leaves
+from jax.tree_util import tree_flatten, tree_unflatten, tree_multimap, tree_leaves
 from jax.interpreters import partial_eval as pe
 
 
 from jax.config import config
 config.parse_flags_with_absl()
 
+
+def setUpModule():
+  # Opt-in, since the cache can only be initialized once per process. Note the
+  # persistent compilation cache is currently only used on TPU.
+  cache_dir = os.environ.get("JAX_TEST_CACHE_DIR")
+  if cache_dir:
+    from jax.experimental.compilation_cache import compilation_cache as cc
+    if not cc.is_initialized():
+      cc.initialize_cache(cache_dir)
+
 _ = pe.PartialVal.unknown(UnshapedArray(np.float32))
 __ = pe.PartialVal.unknown(ShapedArray((), np.float32))
 
@@ -107,35 +117,63 @@ def product_io_fun(x, y):
   return jnp.sin(xa + y2), [xb, (y1, y3)]
 
 
-_rng = np.random.RandomState(42)
-R = _rng.randn
-CallSpec = namedtuple('CallSpec', ['fun', 'args'])
+def seeded_args(make_args):
+  """Returns an args_maker calling make_args with a freshly seeded randn, so
+  that the args don't depend on which other specs were run first."""
+  return lambda: make_args(np.random.RandomState(42).randn)
+
+def primals_and_tangents(args_maker):
+  def make():
+    args = args_maker()
+    return args, args
+  return make
+
+# Args are only built when a test runs, not for every spec at import time.
+CallSpec = namedtuple('CallSpec', ['fun', 'args_maker'])
 test_specs_base = [
-    CallSpec(simple_fun, (R(3, 2), R(3, 2))),
-    CallSpec(simple_fun_fanout, (R(3, 2), R(3, 2))),
-    CallSpec(product_io_fun, ({'a': R(2, 2), 'b': R(2, 2)},
-                              (R(2, 2), (R(2, 2), R(2, 2))))),
-    CallSpec(fun_with_call, (R(3, 2),)),
-    CallSpec(fun_with_two_calls, (R(3, 2),)),
-    CallSpec(fun_with_call_closure, (R(3, 2),)),
-    CallSpec(fun_call_jitted, (R(1,),)),
-    CallSpec(fun_with_nested_calls, (R(),)),
-    CallSpec(fun_with_nested_calls, (R(3, 2),)),
-    CallSpec(fun_with_nested_calls_2, (R(1, 2),)),
+    CallSpec(simple_fun, seeded_args(lambda R: (R(3, 2), R(3, 2)))),
+    CallSpec(simple_fun_fanout, seeded_args(lambda R: (R(3, 2), R(3, 2)))),
+    CallSpec(product_io_fun, seeded_args(
+        lambda R: ({'a': R(2, 2), 'b': R(2, 2)},
+                   (R(2, 2), (R(2, 2), R(2, 2)))))),
+    CallSpec(fun_with_call, seeded_args(lambda R: (R(3, 2),))),
+    CallSpec(fun_with_two_calls, seeded_args(lambda R: (R(3, 2),))),
+    CallSpec(fun_with_call_closure, seeded_args(lambda R: (R(3, 2),))),
+    CallSpec(fun_call_jitted, seeded_args(lambda R: (R(1,),))),
+    CallSpec(fun_with_nested_calls, seeded_args(lambda R: (R(),))),
+    CallSpec(fun_with_nested_calls, seeded_args(lambda R: (R(3, 2),))),
+    CallSpec(fun_with_nested_calls_2, seeded_args(lambda R: (R(1, 2),))),
 ]
 
 def jvp_unlinearized(f, primals, tangents):
   out, jvp = linearize(f, *primals)
   return out, jvp(*tangents)
 
+# Build one jit wrapper per function, so test_jit reuses the wrappers (and
+# their compiled executables) made for test_specs rather than making new ones.
+_memo_jit = lru_cache(maxsize=None)(jit)
+
 test_specs = []
-for ts in test_specs_base:
+for i, ts in enumerate(test_specs_base):
   test_specs.append(ts)
-  test_specs.append(CallSpec(partial(jvp, ts.fun), (ts.args, ts.args)))
-  test_specs.append(CallSpec(jit(ts.fun), ts.args))
-  test_specs.append(CallSpec(jit(jit(ts.fun)), ts.args))
+  test_specs.append(CallSpec(partial(jvp, ts.fun),
+                             primals_and_tangents(ts.args_maker)))
+  test_specs.append(CallSpec(_memo_jit(ts.fun), ts.args_maker))
+  if i < 3:  # a few nested jits are enough, the rest add only retracing
+    test_specs.append(CallSpec(_memo_jit(_memo_jit(ts.fun)), ts.args_maker))
   test_specs.append(CallSpec(partial(jvp_unlinearized, ts.fun),
-                             (ts.args, ts.args)))
+                             primals_and_tangents(ts.args_maker)))
+
+# A list, not a tuple: named_parameters reads a single tuple argument as one
+# named case rather than as a sequence of cases.
+_NAMED_SPECS = [(str(i), spec.fun, spec.args_maker)
+                for i, spec in enumerate(test_specs)]
+
+# The reference cycle tests each run full gc sweeps, which are slow in a large
+# test process. They run by default; set JAX_TEST_REFCYCLES=0 to skip them.
+_skip_refcycle_tests = unittest.skipIf(
+    os.environ.get("JAX_TEST_REFCYCLES", "1") == "0",
+    "reference cycle tests disabled by JAX_TEST_REFCYCLES=0")
 
 
 def fwd_deriv(f):
@@ -147,6 +185,17 @@ def fwd_deriv(f):
 
 class CoreTest(jtu.JaxTestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    # Shared by the reference cycle tests. Made here rather than at import, so
+    # that importing the module doesn't initialize a backend before flags are
+    # parsed.
+    cls._zero_scalar = jnp.zeros([])
+    # Shared by tests that only depend on the relative order of new vars, not
+    # on their names.
+    cls._newsym = core.gensym()
+
   def test_tree_multimap(self):
     xs = ({'a': 1}, [2, 3])
     ys = ({'a': 10}, [20, 30])
@@ -155,11 +204,8 @@ class CoreTest(jtu.JaxTestCase):
 
     f = lambda x, y: x + y
     assert tree_multimap(f, xs, ys) == zs
-    try:
-      tree_multimap(f, xs, ys_bad)
-      assert False
-    except (TypeError, ValueError):
-      pass
+    self.assertRaises((TypeError, ValueError),
+                      lambda: tree_multimap(f, xs, ys_bad))
 
   def test_tree_flatten(self):
     flat, _ = tree_flatten(({'a': 1}, [2, 3], 4))
@@ -170,17 +216,17 @@ class CoreTest(jtu.JaxTestCase):
     flat, treedef = tree_flatten(tree)
     assert flat == [1, 2, 3, 4, 5]
     tree2 = tree_unflatten(treedef, flat)
-    nodes_equal = tree_multimap(operator.eq, tree, tree2)
-    assert tree_reduce(operator.and_, nodes_equal)
+    flat2, treedef2 = tree_flatten(tree2)
+    assert flat2 == flat and treedef2 == treedef
 
-  @parameterized.named_parameters(
-      (str(i), *spec) for i, spec in enumerate(test_specs))
-  def test_jit(self, f, args):
-    jtu.check_close(jit(f)(*args), f(*args))
+  @parameterized.named_parameters(_NAMED_SPECS)
+  def test_jit(self, f, args_maker):
+    args = args_maker()
+    jtu.check_close(_memo_jit(f)(*args), f(*args))
 
-  @parameterized.named_parameters(
-      (str(i), *spec) for i, spec in enumerate(test_specs))
-  def test_jvp(self, f, args):
+  @parameterized.named_parameters(_NAMED_SPECS)
+  def test_jvp(self, f, args_maker):
+    args = args_maker()
     jtu.check_jvp(f, partial(jvp, f), args, rtol={np.float32: 3e-2})
 
   def test_jvp_zeros(self):
@@ -191,14 +237,15 @@ class CoreTest(jtu.JaxTestCase):
 
     jtu.check_eq(jit(foo)(0.5), foo(0.5))
 
-  @parameterized.parameters(test_specs)
-  def test_jvp_linearized(self, f, args):
+  @parameterized.named_parameters(_NAMED_SPECS)
+  def test_jvp_linearized(self, f, args_maker):
+    args = args_maker()
     jtu.check_jvp(f, partial(jvp_unlinearized, f), args,
                   rtol={np.float32: 3e-2})
 
-  @parameterized.named_parameters(
-      (str(i), *spec) for i, spec in enumerate(test_specs))
-  def test_vjp(self, f, args):
+  @parameterized.named_parameters(_NAMED_SPECS)
+  def test_vjp(self, f, args_maker):
+    args = args_maker()
     jtu.check_vjp(f, partial(vjp, f), args,
                   rtol={np.float32: 3e-1, np.float64: 1e-5},
                   atol={np.float32: 1e-2, np.float64: 1e-5})
@@ -264,6 +311,7 @@ class CoreTest(jtu.JaxTestCase):
     assert d2_sin(0.0) == 0.0
     assert d3_sin(0.0) == -1.0
 
+  @_skip_refcycle_tests
   def test_reference_cycles(self):
     gc.collect()
 
@@ -271,7 +319,7 @@ class CoreTest(jtu.JaxTestCase):
       return x.sum()
 
     fn = partial(linearize, f)
-    params = jnp.zeros([])
+    params = self._zero_scalar
 
     debug = gc.get_debug()
     try:
@@ -281,6 +329,7 @@ class CoreTest(jtu.JaxTestCase):
     finally:
       gc.set_debug(debug)
 
+  @_skip_refcycle_tests
   def test_reference_cycles_jit(self):
     gc.collect()
 
@@ -288,7 +337,7 @@ class CoreTest(jtu.JaxTestCase):
       return x.sum()
 
     fn = jit(f)
-    params = jnp.zeros([])
+    params = self._zero_scalar
 
     debug = gc.get_debug()
     try:
@@ -299,7 +348,7 @@ class CoreTest(jtu.JaxTestCase):
       gc.set_debug(debug)
 
   def test_comparing_var(self):
-    newsym = core.gensym()
+    newsym = self._newsym
     a = newsym(core.abstract_unit)
     b = newsym(core.abstract_unit)
     c = newsym(core.abstract_unit)
@@ -308,12 +357,15 @@ class CoreTest(jtu.JaxTestCase):
     assert a != b and b != c and a != c
 
   def test_var_ordering(self):
-    newsym = core.gensym()
+    newsym = self._newsym
     a = newsym(core.abstract_unit)
     b = newsym(core.abstract_unit)
     c = newsym(core.abstract_unit)
-    for ordering in it.permutations([a, b, c]):
-      assert sorted(list(ordering)) == [a, b, c]
+    # Vars are totally ordered by creation, so sorting any one permutation
+    # checks the order sorted relies on.
+    assert a < b and b < c and a < c
+    assert not (b < a or c < b or c < a)
+    assert sorted([c, a, b]) == [a, b, c]
 
   def test_var_compared_by_identity(self):
     a1 = core.gensym()(core.abstract_unit)
@@ -343,8 +395,54 @@ class CoreTest(jtu.JaxTestCase):
         'ConcreteArray([1], dtype=int32)')
 
 
+# The parts of a typechecking error message about an invalid eqn, in order.
+_INVALID_EQN_ERR_RE = re.compile(
+    r'cond branch 0 takes 0 inputs, branch 1 takes 1.*in equation:'
+    r'.*from source:.*while checking jaxpr:', re.DOTALL)
+
+
 class JaxprTypeChecks(jtu.JaxTestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+
+    # These tests only read their jaxprs, so trace them once per class. Tests
+    # that mutate a jaxpr trace their own, after setUp clears the caches.
+    def inner(x):
+      return x + 1, x + 2
+
+    def f_jit(x):
+      _, y = jit(inner)(x)
+      return y + 3
+
+    def f_loop(x):
+      _, y = lax.while_loop(lambda s: s[0] < 0.,
+                            lambda s: (jnp.sin(s[0]), jnp.cos(s[1])),
+                            (x, x))
+      return y + 1.
+
+    def f_cond(x):
+      _, y = lax.cond(x < 0.,
+                      lambda x: (jnp.sin(x), x + 1.),
+                      lambda x: (jnp.cos(x), x + 2.),
+                      x)
+      return y
+
+    with jax.enable_checks(True):
+      cls._simple_jaxpr = make_jaxpr(
+          lambda x: jnp.sin(x) + jnp.cos(x))(1.).jaxpr
+      cls._cond_jaxpr = make_jaxpr(
+          lambda x: lax.switch(0, [jnp.sin, jnp.cos], x))(1.).jaxpr
+      cls._dropvar_jit_jaxpr = make_jaxpr(f_jit)(1).jaxpr
+      cls._dropvar_loop_jaxpr = make_jaxpr(f_loop)(1.).jaxpr
+      cls._dropvar_cond_jaxpr = make_jaxpr(f_cond)(1.).jaxpr
+
+    # Named shape fixtures, shared by the lattice_join and typecompat tests.
+    cls._aval_i10 = core.ShapedArray((2, 3), np.float32, False, {'i': 10})
+    cls._aval_j5 = core.ShapedArray((2, 3), np.float32, False, {'j': 5})
+    cls._aval_i5 = core.ShapedArray((2, 3), np.float32, False, {'i': 5})
+
   def setUp(self):
     super().setUp()
     jax._src.lax.control_flow._initial_style_open_jaxpr.cache_clear()
@@ -352,12 +450,10 @@ class JaxprTypeChecks(jtu.JaxTestCase):
     jax._src.lax.control_flow._initial_style_jaxprs_with_common_consts.cache_clear()
 
   def test_check_jaxpr_correct(self):
-    jaxpr = make_jaxpr(lambda x: jnp.sin(x) + jnp.cos(x))(1.).jaxpr
-    core.check_jaxpr(jaxpr)
+    core.check_jaxpr(self._simple_jaxpr)
 
   def test_check_jaxpr_cond_correct(self):
-    jaxpr = make_jaxpr(lambda x: lax.switch(0, [jnp.sin, jnp.cos], x))(1.).jaxpr
-    core.check_jaxpr(jaxpr)
+    core.check_jaxpr(self._cond_jaxpr)
 
   def test_check_jaxpr_cond_invalid(self):
     jaxpr = make_jaxpr(lambda x: lax.switch(0, [jnp.sin, jnp.cos], x))(1.).jaxpr
@@ -382,18 +478,23 @@ class JaxprTypeChecks(jtu.JaxTestCase):
     # jaxprs can be large, and this tests that when large ones are printed for
     # context in jaxpr typechecking errors, they're not printed entirely
 
-    def enlarge(f, n):
-      def g(x):
-        for _ in range(n):
-          x = x + x
-        x = f(x)
-        for _ in range(n):
-          x = x + x
-        return x
-      return g
+    jaxpr = make_jaxpr(lambda x: lax.switch(0, [jnp.sin, jnp.cos], x))(1.).jaxpr
+
+    # Pad the jaxpr with 100 doublings on either side of the cond. The eqns are
+    # built directly, which is much cheaper than tracing 200 adds.
+    newvar = core.gensym([jaxpr])
+
+    def doublings(x, out, n=100):
+      vs = [x, *(newvar(x.aval) for _ in range(n - 1)), out]
+      return [core.new_jaxpr_eqn([a, a], [b], lax.add_p, {})
+              for a, b in zip(vs[:-1], vs[1:])]
 
-    jaxpr = make_jaxpr(enlarge(
-        lambda x: lax.switch(0, [jnp.sin, jnp.cos], x), 100))(1.).jaxpr
+    x, = jaxpr.invars
+    y, = jaxpr.outvars
+    new_x, new_y = newvar(x.aval), newvar(y.aval)
+    jaxpr = core.Jaxpr(jaxpr.constvars, [new_x], [new_y],
+                       [*doublings(new_x, x), *jaxpr.eqns,
+                        *doublings(y, new_y)])
 
     cond = next(eqn for eqn in jaxpr.eqns if eqn.primitive.name == 'cond')
     cond.params['branches'][0].jaxpr.invars = ()
@@ -403,19 +504,13 @@ class JaxprTypeChecks(jtu.JaxTestCase):
     except core.JaxprTypeError as e:
       msg, = e.args
 
-    self.assertIn('cond branch 0 takes 0 inputs, branch 1 takes 1', msg)
-    self.assertIn('in equation:', msg)
-    self.assertIn('from source:', msg)
-    self.assertIn('while checking jaxpr:', msg)
+    self.assertRegex(msg, _INVALID_EQN_ERR_RE)
     self.assertLess(msg.count('\n'), 200)
 
   def test_check_jaxpr_eqn_mismatch(self):
     def f(x):
       return jnp.sin(x) + jnp.cos(x)
 
-    def new_jaxpr():
-      return make_jaxpr(f)(jnp.float32(1.)).jaxpr
-
     # jaxpr is:
     #
     # { lambda  ; a.
@@ -425,8 +520,11 @@ class JaxprTypeChecks(jtu.JaxTestCase):
     #   in (d,) }
     #
     # NB: eqns[0].outvars[0] and eqns[2].invars[0] are both 'b'
+    #
+    # Each case below only overwrites the aval of 'b', so they can share one
+    # jaxpr rather than re-tracing f.
 
-    jaxpr = new_jaxpr()
+    jaxpr = make_jaxpr(f)(jnp.float32(1.)).jaxpr
     # int, not float!
     jaxpr.eqns[0].outvars[0].aval = make_shaped_array(jnp.int32(2))
     self.assertRaisesRegex(
@@ -435,7 +533,6 @@ class JaxprTypeChecks(jtu.JaxTestCase):
         r"bound as ShapedArray(.*)\n\nin equation:\n\n.:i32\[\] = sin .",
         lambda: core.check_jaxpr(jaxpr))
 
-    jaxpr = new_jaxpr()
     jaxpr.eqns[0].outvars[0].aval = make_shaped_array(
       np.ones((2, 3), dtype=jnp.float32))
     self.assertRaisesRegex(
@@ -445,37 +542,17 @@ class JaxprTypeChecks(jtu.JaxTestCase):
         lambda: core.check_jaxpr(jaxpr))
 
   def test_jaxpr_dropvar_from_jit_call(self):
-    def inner(x):
-      return x + 1, x + 2
-
-    def f(x):
-      _, y = jit(inner)(x)
-      return y + 3
-
-    jaxpr = make_jaxpr(f)(1).jaxpr
+    jaxpr = self._dropvar_jit_jaxpr
     assert isinstance(jaxpr.eqns[0].outvars[0], core.DropVar)
     core.check_jaxpr(jaxpr)
 
   def test_jaxpr_dropvar_from_loop(self):
-    def f(x):
-      _, y = lax.while_loop(lambda s: s[0] < 0.,
-                            lambda s: (jnp.sin(s[0]), jnp.cos(s[1])),
-                            (x, x))
-      return y + 1.
-
-    jaxpr = make_jaxpr(f)(1.).jaxpr
+    jaxpr = self._dropvar_loop_jaxpr
     assert isinstance(jaxpr.eqns[0].outvars[0], core.DropVar)
     core.check_jaxpr(jaxpr)
 
   def test_jaxpr_dropvar_from_cond(self):
-    def f(x):
-      _, y = lax.cond(x < 0.,
-                      lambda x: (jnp.sin(x), x + 1.),
-                      lambda x: (jnp.cos(x), x + 2.),
-                      x)
-      return y
-
-    jaxpr = make_jaxpr(f)(1.).jaxpr
+    jaxpr = self._dropvar_cond_jaxpr
     assert isinstance(jaxpr.eqns[-1].outvars[0], core.DropVar)
     core.check_jaxpr(jaxpr)
 
@@ -498,22 +575,17 @@ class JaxprTypeChecks(jtu.JaxTestCase):
     self.assertEqual(aval.weak_type, weak_type)
 
   def test_lattice_join_named_shape(self):
-    aval1 = core.ShapedArray((2, 3), np.float32, False, {'i': 10})
+    aval1, aval2, aval3 = self._aval_i10, self._aval_j5, self._aval_i5
     self.assertEqual(core.lattice_join(aval1, aval1), aval1)
 
-    aval2 = core.ShapedArray((2, 3), np.float32, False, {'j': 5})
     expected = core.ShapedArray((2, 3), np.float32, False, {'i': 10, 'j': 5})
     self.assertEqual(core.lattice_join(aval1, aval2), expected)
 
-    aval3 = core.ShapedArray((2, 3), np.float32, False, {'i': 5})
     self.assertRaises(TypeError, lambda: core.lattice_join(aval1, aval3))
 
   def test_typecompat_named_shape(self):
-    aval1 = core.ShapedArray((2, 3), np.float32, False, {'i': 10})
-    aval2 = core.ShapedArray((2, 3), np.float32, False, {'j': 5})
+    aval1, aval2, aval3 = self._aval_i10, self._aval_j5, self._aval_i5
     self.assertTrue(core.typecompat(aval1, aval2))
-
-    aval3 = core.ShapedArray((2, 3), np.float32, False, {'i': 5})
     self.assertFalse(core.typecompat(aval1, aval3))
 
 